@@ -1,22 +1,41 @@
 #!/usr/bin/env python3
 from hantek1008c import Hantek1008, CorrectionDataType, ZeroOffsetShiftCompensationFunctionType
-from typing import Union, Optional, List, Dict, Any, IO, TextIO
+from typing import Union, Optional, List, Dict, Any, IO, TextIO, Callable
 import typing
 import logging as log
 import argparse
 import time
 import datetime
 import os
+import io
 import lzma
 import sys
 import math
+import numpy as np
 from usb.core import USBError
 from time import sleep
 from utils.csvwriter import ThreadedCsvWriter, CsvWriter
 from enum import Enum
+from contextlib import ExitStack
+from operator import itemgetter
 
 assert sys.version_info >= (3, 6)
 
+# in roll mode, sample rows are collected and only written (followed by a timestamp comment)
+# and flushed once at least FLUSH_ROWS rows are pending or FLUSH_INTERVAL_SEC passed since the last flush,
+# the latter keeps the output up to date at low sampling rates
+FLUSH_ROWS = 1000
+FLUSH_INTERVAL_SEC = 1.0
+
+# size (in bytes) of the write buffer of output files
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# maximum amount of pending write calls of the csv writer thread
+CSV_WRITER_QUEUE_SIZE = 16
+
+# lzma preset used for '.xz' output files, a low preset keeps the compression cheap enough for high sampling rates
+LZMA_PRESET = 1
+
 # SamplingMode = enum.Enum("SamplingMode", ["BURST", "ROLL"])
 
 
@@ -85,8 +104,9 @@ def main(csv_file_path: str,
         # the vscale value of a channel is the value in vertical_scale_factor
         # on the same index as the channel in selected channel
         # or 1.0 if the channel is not in selected_channels
-        vertical_scale_factor = [1.0 if i not in selected_channels
-                                 else vertical_scale_factor[selected_channels.index(i)]
+        selected_channel_index = {ch: index for index, ch in enumerate(selected_channels)}
+        vertical_scale_factor = [vertical_scale_factor[selected_channel_index[i]] if i in selected_channel_index
+                                 else 1.0
                                  for i in range(8)]
 
     correction_data: CorrectionDataType = [{} for _ in range(8)]  # list of dicts of dicts
@@ -111,7 +131,7 @@ def main(csv_file_path: str,
             channel_id = int(channel_id)
             if len(channel_cdata) == 0:
                 continue
-            log.info(f"Channel {channel_id+1}:")
+            log.info("Channel %d:", channel_id + 1)
             for test in channel_cdata:
                 vscale = test["vscale"]
                 test_voltage = test["test_voltage"]
@@ -122,8 +142,8 @@ def main(csv_file_path: str,
                     continue
                 assert 0.5 < correction_factor < 2.0, "Correction factor seems to be false"
 
-                #log.info(f"    {test} -> {correction_factor}")
-                log.info(f"{test_voltage:>6}V -> {correction_factor:0.5f}")
+                #log.info("    %s -> %s", test, correction_factor)
+                log.info("%6sV -> %0.5f", test_voltage, correction_factor)
 
                 if vscale not in correction_data[channel_id]:
                     correction_data[channel_id][vscale] = {}
@@ -247,99 +267,164 @@ def sample(device: Hantek1008,
         selected_channels += [sc + Hantek1008.channel_count() for sc in selected_channels]
 
     try:
-        # csv_file:  IO[str] = None
-        # output_csv_filename = "channel_data.csv"
-        if csv_file_path == '-':
-            log.info("Exporting data to stdout...")
-            csv_file: IO[str] = sys.stdout
-        elif csv_file_path.endswith(".xz"):
-            log.info(f"Exporting data lzma-compressed to file '{csv_file_path}'...")
-            csv_file = lzma.open(csv_file_path, 'at', newline='')
-        else:
-            log.info(f"Exporting data to file '{csv_file_path}'...")
-            csv_file = open(csv_file_path, 'at', newline='')
-
-        csv_writer: CsvWriter = ThreadedCsvWriter(csv_file, delimiter=',')
-
-        csv_writer.write_comment("HEADER")
-
-        now = datetime.datetime.now()
-        # timestamps are by nature UTC
-        csv_writer.write_comment(f"UNIX-Time: {now.timestamp()}")
-        csv_writer.write_comment(f"UNIX-Time: {now.astimezone(datetime.timezone.utc).isoformat()} UTC")
-
-        # channel >= 8 are the raw values of the corresponding channels < 8
-        channel_titles = [f'ch_{i+1 if i < 8 else (str(i+1-8)+"_raw")}' for i in selected_channels]
-        if timestamp_style == "first_column":
-            channel_titles = ["time"] + channel_titles
-        csv_writer.write_comment(f"{', '.join(channel_titles)}")
-
-        csv_writer.write_comment(f"sampling mode: {str(sampling_mode)}")
-
-        csv_writer.write_comment(f"intended samplingrate: {sampling_rate} Hz")
-        csv_writer.write_comment(f"samplingrate: {computed_actual_sampling_rate} Hz")
-        if measured_sampling_rate:
-            csv_writer.write_comment(f"measured samplingrate: {measured_sampling_rate} Hz")
-
-        csv_writer.write_comment(f"vscale: {', '.join(str(f) for f in vertical_scale_factor)}")
-        csv_writer.write_comment("# zero offset data:")
-        zero_offsets = device.get_zero_offsets()
-        assert zero_offsets is not None
-        for vscale, zero_offset in sorted(zero_offsets.items()):
-            csv_writer.write_comment(f"zero_offset [{vscale:<4}]: {' '.join([str(round(v, 1)) for v in zero_offset])}")
-
-        csv_writer.write_comment(f"zosc-method: {device.get_used_zero_offsets_shift_compensation_method()}")
-
-        csv_writer.write_comment(f"DATA")
-
-        # TODO: make this configurable
-        milli_volt_int_representation = False
-
-        def write_per_channel_data(per_channel_data: Dict[int, Union[List[int], List[float]]],
-                                   time_of_first_value: Optional[float],
-                                   time_of_last_value: float) \
-                -> None:
-            # sort all channels the same way as in selected_channels
-            per_channel_data_list = [per_channel_data[ch] for ch in selected_channels]
-
-            if milli_volt_int_representation:
-                per_channel_data_list = [[int(round(value*1000)) for value in single_channel]
-                                         for single_channel in per_channel_data_list]
-
-            if timestamp_style == "first_column":
-                assert time_of_first_value is not None
-                values_per_channel_count = len(per_channel_data_list[0])
-                deltatime_per_value = (time_of_last_value - time_of_first_value) / values_per_channel_count
-                timestamps_interpolated = [time_of_first_value + i * deltatime_per_value
-                                           for i in range(values_per_channel_count)]
-                csv_writer.write_rows(zip(timestamps_interpolated, *per_channel_data_list))
-            else:  # timestamp_style == "own_row":
-                csv_writer.write_rows(zip(*per_channel_data_list))
-                # timestamps are by nature UTC
-                csv_writer.write_comment(f"UNIX-Time: {time_of_last_value}")
-
-        if sampling_mode == SamplingMode.ROLL:
-            last_timestamp = datetime.datetime.now().timestamp()
-            for per_channel_data in device.request_samples_roll_mode(mode=str(raw_or_volt), sampling_rate=sampling_rate):
-                now_timestamp = datetime.datetime.now().timestamp()
-                write_per_channel_data(per_channel_data, last_timestamp, now_timestamp)
-                last_timestamp = now_timestamp
-        else:  # burst mode
-            # TODO currently not supported
-            # TODO missing features:
-            # * timestamp_style
-            assert timestamp_style == TimestampStyle.OWN_ROW
-            while True:
-                per_channel_data = device.request_samples_burst_mode()
-                now_timestamp = datetime.datetime.now().timestamp()
-                write_per_channel_data(per_channel_data, None, now_timestamp)
+        with ExitStack() as stack:
+            # csv_file:  IO[bytes] = None
+            # output_csv_filename = "channel_data.csv"
+            if csv_file_path == '-':
+                log.info("Exporting data to stdout...")
+                # write to the file descriptor of stdout with a large buffer (like for files) instead of using
+                # sys.stdout, that is line buffered if it is a terminal. Closing csv_file will not close stdout.
+                sys.stdout.flush()
+                csv_file: IO[bytes] = stack.enter_context(
+                    open(sys.stdout.fileno(), 'wb', buffering=OUTPUT_BUFFER_SIZE, closefd=False))
+            elif csv_file_path.endswith(".xz"):
+                log.info(f"Exporting data lzma-compressed to file '{csv_file_path}'...")
+                csv_file = stack.enter_context(
+                    io.BufferedWriter(lzma.LZMAFile(csv_file_path, 'a', preset=LZMA_PRESET),
+                                      buffer_size=OUTPUT_BUFFER_SIZE))
+            else:
+                log.info(f"Exporting data to file '{csv_file_path}'...")
+                csv_file = stack.enter_context(open(csv_file_path, 'ab', buffering=OUTPUT_BUFFER_SIZE))
+
+            # the files are opened in binary mode, so the csv writer encodes every (already complete) chunk of text once
+            csv_writer: CsvWriter = ThreadedCsvWriter(csv_file, delimiter=',', encoding='utf-8',
+                                                      max_queue_size=CSV_WRITER_QUEUE_SIZE)
+            # whatever ends the sampling (user, USB error, ..), the writer thread has to finish all pending writes
+            # and close csv_file, only then the last block of a lzma compressed file is complete
+            stack.callback(csv_writer.close)
+
+            # the header is collected and written at once
+            header_comments: List[str] = ["HEADER"]
+
+            now = datetime.datetime.now()
+            # timestamps are by nature UTC
+            header_comments.append(f"UNIX-Time: {now.timestamp()}")
+            header_comments.append(f"UNIX-Time: {now.astimezone(datetime.timezone.utc).isoformat()} UTC")
+
+            # channel >= 8 are the raw values of the corresponding channels < 8
+            channel_titles = [f'ch_{i+1 if i < 8 else (str(i+1-8)+"_raw")}' for i in selected_channels]
+            if timestamp_style == TimestampStyle.FIRST_COLUMN:
+                channel_titles = ["time"] + channel_titles
+            header_comments.append(f"{', '.join(channel_titles)}")
+
+            header_comments.append(f"sampling mode: {str(sampling_mode)}")
+
+            header_comments.append(f"intended samplingrate: {sampling_rate} Hz")
+            header_comments.append(f"samplingrate: {computed_actual_sampling_rate} Hz")
+            if measured_sampling_rate:
+                header_comments.append(f"measured samplingrate: {measured_sampling_rate} Hz")
+
+            header_comments.append(f"vscale: {', '.join(str(f) for f in vertical_scale_factor)}")
+            header_comments.append("# zero offset data:")
+            zero_offsets = device.get_zero_offsets()
+            assert zero_offsets is not None
+            for vscale, zero_offset in sorted(zero_offsets.items()):
+                header_comments.append(f"zero_offset [{vscale:<4}]: "
+                                       f"{' '.join([str(round(v, 1)) for v in zero_offset])}")
+
+            header_comments.append(f"zosc-method: {device.get_used_zero_offsets_shift_compensation_method()}")
+
+            header_comments.append(f"DATA")
+            csv_writer.write_comments(header_comments)
+
+            # TODO: make this configurable
+            milli_volt_int_representation = False
+
+            # printf-style format of every data column, channel >= 8 and all channels in raw mode are integers,
+            # volts get exactly as many digits after the dot as the device rounds them to for the channel's vscale
+            column_formats = ["%d" if milli_volt_int_representation
+                              or raw_or_volt == RawVoltMode.RAW
+                              or ch >= Hantek1008.channel_count()
+                              else f"%.{Hantek1008.volt_accuracy(vertical_scale_factor[ch])}f"
+                              for ch in selected_channels]
+            if timestamp_style == TimestampStyle.FIRST_COLUMN:
+                column_formats = ["%.6f"] + column_formats
+            format_rows = csv_writer.row_formatter(column_formats)
+
+            # picks the selected channels (in the order of selected_channels) from the per channel dict in one go,
+            # for a single channel the result is not a tuple but the channel data itself
+            get_selected_channels = itemgetter(*selected_channels)
+
+            def to_volts(rows: np.ndarray) -> np.ndarray:
+                return rows
+
+            def to_milli_volt_ints(rows: np.ndarray) -> np.ndarray:
+                return np.rint(rows * 1000.0).astype(np.int32)
+
+            # the representation does not change while sampling, so the conversion is chosen only once
+            convert_values: Callable[[np.ndarray], np.ndarray] = \
+                to_milli_volt_ints if milli_volt_int_representation else to_volts
+
+            pending_rows: List[np.ndarray] = []
+            pending_rows_count = 0
+            pending_time_of_last_value: Optional[float] = None
+
+            def write_per_channel_data(per_channel_data: Dict[int, np.ndarray],
+                                       time_of_first_value: Optional[float],
+                                       time_of_last_value: float) \
+                    -> None:
+                nonlocal pending_rows_count, pending_time_of_last_value
+                # sort all channels the same way as in selected_channels
+                # and stack them to one row per sample, one column per channel
+                rows = np.array(get_selected_channels(per_channel_data), ndmin=2).T
+
+                rows = convert_values(rows)
+
+                if timestamp_style == TimestampStyle.FIRST_COLUMN:
+                    assert time_of_first_value is not None
+                    values_per_channel_count = len(rows)
+                    deltatime_per_value = (time_of_last_value - time_of_first_value) / values_per_channel_count
+                    timestamps_interpolated = \
+                        time_of_first_value + np.arange(values_per_channel_count) * deltatime_per_value
+                    rows = np.column_stack((timestamps_interpolated, rows))
+
+                pending_rows.append(rows)
+                pending_rows_count += len(rows)
+                pending_time_of_last_value = time_of_last_value
+
+            def flush_pending_rows() -> None:
+                nonlocal pending_rows_count
+                if len(pending_rows) == 0:
+                    return
+                csv_writer.write_array(np.concatenate(pending_rows), format_rows)
+                pending_rows.clear()
+                pending_rows_count = 0
+
+                if timestamp_style != TimestampStyle.FIRST_COLUMN:  # timestamp_style == TimestampStyle.OWN_ROW:
+                    # timestamps are by nature UTC
+                    csv_writer.write_comment(f"UNIX-Time: {pending_time_of_last_value}")
+                csv_writer.flush()
+
+            try:
+                if sampling_mode == SamplingMode.ROLL:
+                    last_timestamp = time.time()
+                    last_flush_timestamp = last_timestamp
+                    for per_channel_data in device.request_samples_roll_mode(mode=str(raw_or_volt),
+                                                                             sampling_rate=sampling_rate):
+                        now_timestamp = time.time()
+                        write_per_channel_data(per_channel_data, last_timestamp, now_timestamp)
+                        last_timestamp = now_timestamp
+                        if pending_rows_count >= FLUSH_ROWS \
+                                or now_timestamp - last_flush_timestamp >= FLUSH_INTERVAL_SEC:
+                            flush_pending_rows()
+                            last_flush_timestamp = now_timestamp
+                else:  # burst mode
+                    # TODO currently not supported
+                    # TODO missing features:
+                    # * timestamp_style
+                    assert timestamp_style == TimestampStyle.OWN_ROW
+                    while True:
+                        per_channel_data = device.request_samples_burst_mode()
+                        now_timestamp = time.time()
+                        write_per_channel_data(per_channel_data, None, now_timestamp)
+                        # every burst is a window of its own, so it keeps its own timestamp
+                        flush_pending_rows()
+            finally:
+                # do not lose the already received rows, whatever stopped the sampling
+                flush_pending_rows()
 
     except KeyboardInterrupt:
         log.info("Sample collection was stopped by user")
-        pass
-
-    if csv_writer:
-        csv_writer.close()
 
 
 def measure_sampling_rate(device: Hantek1008, used_sampling_rate: float, measurment_duration: float) -> float:
@@ -411,15 +496,15 @@ def calibration_routine(device: Hantek1008, calibrate_file_path: str, channels_a
 
             device.pause()
 
-            channel_data = list(zip(*data))
-
-            for calibrated_channel_id in range(channel_id, channel_id+channels_at_once):
-                cd = channel_data[calibrated_channel_id]
-                avg = sum(cd) / len(cd)
+            # every row is a dict (channel id -> value), build an array with one column per calibrated channel
+            calibrated_channel_ids = list(range(channel_id, channel_id+channels_at_once))
+            channel_data = np.array([[row[ch] for ch in calibrated_channel_ids] for row in data], dtype=np.float64)
+            channel_averages = channel_data.mean(axis=0)
 
+            for calibrated_channel_id, avg in zip(calibrated_channel_ids, channel_averages):
                 calibration_data[calibrated_channel_id].append({
                     "test_voltage": test_voltage,
-                    "measured_value": round(avg, 2),
+                    "measured_value": round(float(avg), 2),
                     "vscale": device.get_vscales()[calibrated_channel_id],
                     "zero_offset": round(device.get_zero_offset(channel_id=calibrated_channel_id), 2)
                 })
@@ -463,7 +548,7 @@ Collect data from device 'Hantek 1008'. Usage examples:
                                type=str, default=None,
                                help='Exports measured data to the given file in CSV format.'
                                     " If the filename ends with '.xz' the content is compressed using lzma/xz."
-                                    " This reduces the file size to ~ 1/12 compared to the uncompressed format."
+                                    " This reduces the file size to a fraction of the uncompressed format."
                                     " Those files can be decompressed using 'xz -dk <filename>'.")
     command_group.add_argument('--calibrate', metavar=('calibrationfile_path', 'channels_at_once'), nargs=2,
                                type=str, default=None,
@@ -528,9 +613,9 @@ Collect data from device 'Hantek 1008'. Usage examples:
     parser.add_argument('-t', '--timestampstyle', dest="timestamp_style",
                         type=TimestampStyle, default=TimestampStyle.OWN_ROW, nargs='?', choices=list(TimestampStyle),
                         help="Specifies the style of the timestamps included in the CSV output. There"
-                             " are two options: When the 'own_row' style is used, every time the device sends a bunch"
-                             " of measured samples, these are written to the CSV output followed by one row with the"
-                             " timestamp."
+                             " are two options: When the 'own_row' style is used, the measured samples are written"
+                             f" in blocks (at most {FLUSH_ROWS} rows or about every {FLUSH_INTERVAL_SEC:g} sec,"
+                             " whichever comes first), each followed by one row with the timestamp of its last sample."
                              " Use the 'first_column' option to let the first column of each line have an interpolated"
                              " timestamp. Default is 'own_row'.")
 
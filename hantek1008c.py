@@ -9,6 +9,7 @@ import math
 from threading import Thread
 import copy
 import sys
+import numpy as np
 
 # marking a child class method with overrides makes sure the method overrides a parent class method.
 # this check is only needed during development so its no problem if this package is not installed.
@@ -134,7 +135,10 @@ class Hantek1008CRaw:
 		start_time = time.time()
 
 		assert isinstance(message, bytes)
-		log.debug(f">[{len(message):2}] {bytes.hex(message)}")
+		# this is called for every 64 byte package, so only format the debug messages if they are used
+		debug = log.getLogger().isEnabledFor(log.DEBUG)
+		if debug:
+			log.debug(f">[{len(message):2}] {bytes.hex(message)}")
 
 		sleep(sec_till_start)
 
@@ -144,8 +148,9 @@ class Hantek1008CRaw:
 
 		response = bytes(self.__in.read(response_length))
 
-		log.debug(f"<[{len(response):2}] {bytes.hex(response)}")
-		log.debug(f"delta: {time.time()-start_time:02.4f} sec")
+		if debug:
+			log.debug(f"<[{len(response):2}] {bytes.hex(response)}")
+			log.debug(f"delta: {time.time()-start_time:02.4f} sec")
 		assert len(response) == response_length
 
 		return response
@@ -180,11 +185,11 @@ class Hantek1008CRaw:
 		sample_length = int.from_bytes(response, byteorder="big", signed=False)
 		sample_packages_count = int(math.ceil(sample_length / self.__MAX_PACKAGE_SIZE))
 		# print("sample_length: {} -> {} packages".format(sample_length, sample_packages_count))
-		samples = b''
+		samples = bytearray()
 		for _ in range(sample_packages_count):
 			response = self.__send_cmd(0xa6, parameter=[parameter], response_length=64, echo_expected=False)
 			samples += response
-		return samples[0:sample_length]
+		return bytes(samples[0:sample_length])
 
 	def __send_a55a_command(self, attempts: int=20) -> None:
 		for _ in range(attempts):
@@ -345,7 +350,7 @@ class Hantek1008CRaw:
 			samples = samples2 + samples3
 			shorts = Hantek1008CRaw.__from_bytes_to_shorts(samples)
 			per_channel_data = Hantek1008CRaw.__to_per_channel_lists(shorts, Hantek1008CRaw.valid_channel_ids())
-			zero_offset_per_channel = [sum(per_channel_data[ch]) / float(len(per_channel_data[ch]))
+			zero_offset_per_channel = [float(np.mean(per_channel_data[ch]))
 									   for ch in Hantek1008CRaw.valid_channel_ids()]
 			self._zero_offsets[vscale] = zero_offset_per_channel
 
@@ -353,7 +358,7 @@ class Hantek1008CRaw:
 		self.__send_cmd(0xf6, sec_till_response_request=0.2132)
 
 		response = self.__send_cmd(0xe5, echo_expected=False, response_length=2)
-		print(response)
+		log.debug("e5 response: %s", response.hex())
 		#assert response == bytes.fromhex("dc06")	# 1008C
 		# assert response == bytes.fromhex("dc06")  # 1008
 
@@ -404,7 +409,7 @@ class Hantek1008CRaw:
 		response = self.__send_cmd(0xe9, echo_expected=False, response_length=2)
 		assert response == bytes.fromhex("0109")
 
-	def request_samples_burst_mode(self) -> Dict[int, List[int]]:
+	def request_samples_burst_mode(self) -> Dict[int, np.ndarray]:
 		"""get the data"""
 
 		self.__send_ping()
@@ -469,11 +474,12 @@ class Hantek1008CRaw:
 	def request_samples_roll_mode_single_row(self, **argv) \
 			-> Generator[Dict[int, int], None, None]:
 		for per_channel_data in self.request_samples_roll_mode(**argv):
-			for row in list(zip(*per_channel_data.values())):
+			# tolist() unboxes every channel array in one go, iterating the arrays would create a numpy scalar per value
+			for row in zip(*[values.tolist() for values in per_channel_data.values()]):
 				yield dict(zip(per_channel_data.keys(), row))
 
 	def request_samples_roll_mode(self, sampling_rate: int = 440) \
-			-> Generator[Dict[int, List[int]], None, None]:
+			-> Generator[Dict[int, np.ndarray], None, None]:
 
 		assert sampling_rate in Hantek1008CRaw.__roll_mode_sampling_rate_to_id_dic, \
 			f"sample_rate must be in {Hantek1008CRaw.__roll_mode_sampling_rate_to_id_dic.keys()}"
@@ -503,7 +509,8 @@ class Hantek1008CRaw:
 					#  (active_channels + ONE_MYSTIC_EXTRA_CHANNEL) * TWO_BYTES_PER_SAMPLE * row_count
 					assert ready_data_length % ((len(self.__active_channels) + 1)*2) == 0
 
-				sample_response = b''
+				# bytearray grows in place, concatenating bytes would copy the whole response for every package
+				sample_response = bytearray()
 				while ready_data_length > 0:
 					sample_response_part = self.__send_cmd(0xc8, response_length=64, echo_expected=False)
 
@@ -650,16 +657,17 @@ class Hantek1008CRaw:
 		return copy.deepcopy(self.__active_channels)
 
 	@staticmethod
-	def __from_bytes_to_shorts(data: bytes) -> List[int]:
+	def __from_bytes_to_shorts(data: Union[bytes, bytearray]) -> np.ndarray:
 		"""Take two following bytes to build a integer (using little endianess) """
 		assert len(data) % 2 == 0
-		return [data[i] + data[i + 1] * 256 for i in range(0, len(data), 2)]
+		return np.frombuffer(data, dtype="<u2")
 
 	@staticmethod
-	def __to_per_channel_lists(shorts: List[int], active_channels: List[int], expect_ninth_channel: bool = False
-							   ) -> Dict[int, List[int]]:
-		"""Create a dictionary (of the size of 'channel_count') of lists,
+	def __to_per_channel_lists(shorts: np.ndarray, active_channels: List[int], expect_ninth_channel: bool = False
+							   ) -> Dict[int, np.ndarray]:
+		"""Create a dictionary (of the size of 'channel_count') of arrays,
 		where the dictionary at key x contains the data for channel x+1 of the hantek device.
+		The arrays are strided views on the given shorts, no values are copied.
 		In rolling mode there is an additional 9th channel, with values around 1742 this
 		channel will not be past to the caller.
 		"""
@@ -734,7 +742,7 @@ class Hantek1008(Hantek1008CRaw):
 			return f"function {self.__zero_offset_shift_compensation_function}"
 		return None
 
-	def __update_zero_offset_compensation_value(self, zero_readings: List[int]) -> None:
+	def __update_zero_offset_compensation_value(self, zero_readings: np.ndarray) -> None:
 		# TODO problem zero offset different on different vscales?
 		assert self.__zero_offset_shift_compensation_channel is not None
 		assert self._zero_offsets is not None
@@ -743,13 +751,15 @@ class Hantek1008(Hantek1008CRaw):
 		zoscc_zero_offset = self._zero_offsets[zoscc_vscale][self.__zero_offset_shift_compensation_channel]
 
 		adaption_factor = 0.00002  # [0,1]
-		for v in zero_readings:
+		# iterate python ints, looping over the array would do this per sample arithmetic on numpy scalars
+		# and turn the stored compensation value into a numpy float
+		for v in zero_readings.tolist():
 			# print("v", v, "zo", zoscc_zero_offset)
 			delta = v - zoscc_zero_offset
 			self.__zero_offset_shift_compensation_value = \
 				(1.0 - adaption_factor) * self.__zero_offset_shift_compensation_value \
 				+ adaption_factor * delta
-		log.debug("zosc-value", self.__zero_offset_shift_compensation_value)
+		log.debug("zosc-value: %s", self.__zero_offset_shift_compensation_value)
 
 	@overrides
 	def get_zero_offset(self, channel_id: int, vscale: Optional[float] = None) -> float:
@@ -769,12 +779,13 @@ class Hantek1008(Hantek1008CRaw):
 	def request_samples_roll_mode_single_row(self, **argv)\
 			-> Generator[Dict[int, float], None, None]:
 		for per_channel_data in self.request_samples_roll_mode(**argv):
-			for row in list(zip(*per_channel_data.values())):
+			# tolist() unboxes every channel array in one go, iterating the arrays would create a numpy scalar per value
+			for row in zip(*[values.tolist() for values in per_channel_data.values()]):
 				yield dict(zip(per_channel_data.keys(), row))
 
 	@overrides
 	def request_samples_roll_mode(self, sampling_rate: int = 440, mode: str = "volt") \
-			-> Generator[Dict[int, Union[List[float], List[int]]], None, None]:
+			-> Generator[Dict[int, np.ndarray], None, None]:
 
 		assert mode in ["volt", "raw", "volt+raw"]
 		active_channel_count = len(Hantek1008CRaw.get_active_channels(self))
@@ -783,22 +794,31 @@ class Hantek1008(Hantek1008CRaw):
 			assert len(raw_per_channel_data) == active_channel_count
 			yield self.__process_raw_per_channel_data(raw_per_channel_data, mode)
 
-	def __remove_zosc_channel_data(self, per_channel_data: Dict[int, Union[List[int], List[float]]]) -> None:
+	def __remove_zosc_channel_data(self, per_channel_data: Dict[int, np.ndarray]) -> None:
 		if self.__zero_offset_shift_compensation_channel is not None:
 			if self.__zero_offset_shift_compensation_channel in per_channel_data:
 				del per_channel_data[self.__zero_offset_shift_compensation_channel]
 			if self.__zero_offset_shift_compensation_channel + Hantek1008CRaw.channel_count() in per_channel_data:
 				del per_channel_data[self.__zero_offset_shift_compensation_channel]
 
-	def __extract_channel_volts(self, per_channel_data: Dict[int, List[int]]) -> Dict[int, List[float]]:
+	def __extract_channel_volts(self, per_channel_data: Dict[int, np.ndarray]) -> Dict[int, np.ndarray]:
 		"""Extract the voltage values from the raw byte array that came from the device"""
 		if self.__zero_offset_shift_compensation_channel is not None:
 			self.__update_zero_offset_compensation_value(
 				per_channel_data[self.__zero_offset_shift_compensation_channel])
 		return {ch: self.__raw_to_volt(channel_data, ch) for ch, channel_data in per_channel_data.items()}
 
-	def __raw_to_volt(self, raw_values: List[int], channel_id: int) -> List[float]:
-		"""Convert the raw shorts to useful volt values"""
+	@staticmethod
+	def volt_accuracy(vscale: float) -> int:
+		"""Amount of digits after the dot of volt values measured with the given vscale that are not nearly random"""
+		# accuracy = -int(math.log10(scale)) + 2  # amount of digits after the dot that is not nearly random
+		return [3, 4, 5][Hantek1008CRaw._vertical_scale_factor_to_id(vscale) - 1]
+
+	def __raw_to_volt(self, raw_values: np.ndarray, channel_id: int) -> np.ndarray:
+		"""
+		Convert the raw shorts to useful volt values. The values are not rounded, round them to
+		volt_accuracy(vscale) digits after the dot when printing them (e.g. with '%.<accuracy>f').
+		"""
 		vscale = 1.0
 		zero_offset = 2048
 
@@ -809,12 +829,15 @@ class Hantek1008(Hantek1008CRaw):
 
 		scale = 0.01 * vscale
 
-		# accuracy = -int(math.log10(scale)) + 2  # amount of digits after the dot that is not nearly random
-		accuracy = [3, 4, 5][Hantek1008CRaw._vertical_scale_factor_to_id(vscale) - 1]
-		return [round(
-			self.__calc_correction_factor(v - zero_offset, channel_id, vscale) * (v - zero_offset) * scale
-			, ndigits=accuracy)
-			for v in raw_values]
+		# the raw values are unsigned shorts, convert them before subtracting to not wrap around
+		deltas_to_zero = raw_values.astype(np.float64) - zero_offset
+		correction_factors: Union[float, np.ndarray] = 1.0
+		if channel_id in Hantek1008CRaw.valid_channel_ids() and len(self.__correction_data[channel_id]) > 0:
+			correction_factors = np.array([self.__calc_correction_factor(d, channel_id, vscale)
+										   for d in deltas_to_zero.tolist()])
+		# np.round would round the scaled binary value half to even and not the exact value like round() does,
+		# so the rounding is left to the (exact) formatting of the values
+		return correction_factors * deltas_to_zero * scale
 
 	def __calc_correction_factor(self, delta_to_zero: float, channel_id: int, vscale: float) -> float:
 		"""
@@ -854,10 +877,10 @@ class Hantek1008(Hantek1008CRaw):
 		alpha = (delta_to_zero - units_less) / (units_greater - units_less)
 		return (1.0 - alpha) * cfactor_less + alpha * cfactor_greater
 
-	def __process_raw_per_channel_data(self, raw_per_channel_data: Dict[int, List[int]], mode: str
-									   ) -> Dict[int, Union[List[int], List[float]]]:
+	def __process_raw_per_channel_data(self, raw_per_channel_data: Dict[int, np.ndarray], mode: str
+									   ) -> Dict[int, np.ndarray]:
 		assert mode in ["raw", "volt", "volt+raw"]
-		result: Dict[int, Union[List[float], List[int]]] = {}
+		result: Dict[int, np.ndarray] = {}
 		if "volt" in mode:
 			result.update(self.__extract_channel_volts(raw_per_channel_data))
 		if "raw" in mode:
@@ -869,7 +892,7 @@ class Hantek1008(Hantek1008CRaw):
 
 	@overrides
 	def request_samples_burst_mode(self, mode: str = "volt"
-								   ) -> Dict[int, Union[List[int], List[float]]]:
+								   ) -> Dict[int, np.ndarray]:
 		assert self.__zero_offset_shift_compensation_channel is None, \
 			"zero offset shift compensation is not implemented for burst mode"
 		raw_per_channel_data = Hantek1008CRaw.request_samples_burst_mode(self)
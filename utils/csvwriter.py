@@ -1,7 +1,9 @@
-from typing import List, Any, Sequence, Callable, IO
+from typing import List, Dict, Any, Sequence, Callable, IO, Optional
 import threading
 import queue
 import csv
+import codecs
+import numpy as np
 
 # marking a child classes method with overrides makes sure the method overrides a parent class method
 # this check is only needed during development so its no problem if this package is not installed
@@ -15,12 +17,25 @@ except ImportError:
 
 class CsvWriter:
 
-    def __init__(self, file: IO[str], delimiter: str) -> None:
+    def __init__(self, file: IO, delimiter: str, encoding: Optional[str] = None) -> None:
+        """
+        :param encoding: if None, file must be opened in text mode. Otherwise file must be opened in
+            binary mode and all content is encoded with the given encoding before it is written.
+        """
         self.__csv_file = file
-        self.__csv_writer = csv.writer(file, delimiter=delimiter)
+        self.__delimiter = delimiter
+        self.__encoding = encoding
+        self.__csv_writer = csv.writer(file if encoding is None else codecs.getwriter(encoding)(file),
+                                       delimiter=delimiter)
+
+    def __write(self, text: str) -> None:
+        self.__csv_file.write(text if self.__encoding is None else text.encode(self.__encoding))
 
     def write_comment(self, comment: str) -> None:
-        self.__csv_file.write(f"# {comment}\n")
+        self.__write(f"# {comment}\n")
+
+    def write_comments(self, comments: Sequence[str]) -> None:
+        self.__write("".join([f"# {comment}\n" for comment in comments]))
 
     def write_row(self, row: Sequence[Any]) -> None:
         self.__csv_writer.writerow(row)
@@ -28,19 +43,55 @@ class CsvWriter:
     def write_rows(self, rows: Sequence[Sequence[Any]]) -> None:
         self.__csv_writer.writerows(rows)
 
+    def row_formatter(self, column_formats: Sequence[str]) -> Callable[[List[List[Any]]], str]:
+        """
+        Generate a function that formats a list of rows to csv lines. The printf-style formats
+        (one per column, e.g. "%.6g" or "%d") are compiled into the source of a single f-string,
+        so there is neither a loop over the columns nor any format parsing per row.
+        """
+        assert len(column_formats) > 0
+        assert all(f.startswith("%") for f in column_formats)
+        # '%d' also accepts floats but the 'd' format spec does not, '.0f' prints integral values the same way
+        format_specs = [f[1:-1] + ".0f" if f.endswith("d") else f[1:] for f in column_formats]
+        column_names = [f"c{i}" for i in range(len(column_formats))]
+        delimiter = self.__delimiter.replace("{", "{{").replace("}", "}}")
+        line = delimiter.join(f"{{{name}:{spec}}}" for name, spec in zip(column_names, format_specs)) + "\n"
+        source = (f"def format_rows(rows):\n"
+                  f"    return ''.join([f{line!r} for {', '.join(column_names)}, in rows])\n")
+        namespace: Dict[str, Any] = {}
+        exec(source, namespace)
+        return namespace["format_rows"]
+
+    def write_array(self, rows: np.ndarray, format_rows: Callable[[List[List[Any]]], str]) -> None:
+        """Write a 2D array (one row per line) using a function created by row_formatter()"""
+        # tolist() converts the whole array to python lists in C, which is far cheaper than
+        # iterating over the array and boxing every single element as a numpy scalar
+        self.__write(format_rows(rows.tolist()))
+
+    def flush(self) -> None:
+        self.__csv_file.flush()
+
     def close(self) -> None:
         self.__csv_file.close()
 
 
 class ThreadedCsvWriter(CsvWriter):
     """
-    Writes content to a csv file using an extra thread
+    Writes content to a csv file using an extra thread.
+    So formatting and (e.g. lzma) compression do not block the thread that produces the content.
+    If max_queue_size is > 0 at most that many write calls are pending, further calls block until
+    the writing thread catches up, this bounds the memory usage if the file is slower than the producer.
+    If a write fails in the writing thread (e.g. disk full), the exception is raised by the next
+    write call (or by close), all later writes are discarded.
     """
 
-    def __init__(self, file: IO[str], delimiter: str) -> None:
-        super().__init__(file, delimiter)
+    def __init__(self, file: IO, delimiter: str, encoding: Optional[str] = None, max_queue_size: int = 0) -> None:
+        super().__init__(file, delimiter, encoding)
         self.__closed: bool = False
-        self.__work_queue: queue.Queue = queue.Queue()  # a thread-safe FIFO queue
+        # exception raised by a write in the work thread, it is raised again (once) in the calling thread
+        self.__error: Optional[BaseException] = None
+        self.__error_raised: bool = False
+        self.__work_queue: queue.Queue = queue.Queue(maxsize=max_queue_size)  # a thread-safe FIFO queue
         self.__work_thread = threading.Thread(target=self.__do_work)
         self.__work_thread.start()
 
@@ -48,6 +99,10 @@ class ThreadedCsvWriter(CsvWriter):
     def write_comment(self, comment: str) -> None:
         self.__enqueue_work(super().write_comment, comment)
 
+    @overrides
+    def write_comments(self, comments: Sequence[str]) -> None:
+        self.__enqueue_work(super().write_comments, comments)
+
     @overrides
     def write_row(self, row: Sequence[Any]) -> None:
         self.__enqueue_work(super().write_row, row)
@@ -56,18 +111,43 @@ class ThreadedCsvWriter(CsvWriter):
     def write_rows(self, rows: Sequence[Sequence[Any]]) -> None:
         self.__enqueue_work(super().write_rows, rows)
 
+    @overrides
+    def write_array(self, rows: np.ndarray, format_rows: Callable[[List[List[Any]]], str]) -> None:
+        self.__enqueue_work(super().write_array, rows, format_rows)
+
+    @overrides
+    def flush(self) -> None:
+        self.__enqueue_work(super().flush)
+
     def __enqueue_work(self, func: Callable, *params: Any) -> None:
-        self.__work_queue.put((func, params))
+        self.__raise_error()
+        # the last item says whether the work is also done after a write failed, only close's stop is
+        self.__work_queue.put((func, params, False))
+
+    def __raise_error(self) -> None:
+        if self.__error is not None and not self.__error_raised:
+            self.__error_raised = True
+            raise self.__error
 
     def __do_work(self) -> None:
         while not self.__closed:
-            func, params = self.__work_queue.get()
-            func(*params)
+            func, params, run_after_error = self.__work_queue.get()
+            # after a failed write the queue is still drained, so a producer never blocks on a full queue
+            if self.__error is not None and not run_after_error:
+                continue
+            try:
+                func(*params)
+            except BaseException as e:
+                if self.__error is None:
+                    self.__error = e
 
     def close(self) -> None:
         def stop() -> None:
             self.__closed = True
             # super without arguments does not work here inside a locally defined function
             super(ThreadedCsvWriter, self).close()
-        self.__enqueue_work(stop)
+        # bypasses __enqueue_work, the work thread must stop (and the file be closed)
+        # even if a write failed before, the failure is raised after that
+        self.__work_queue.put((stop, (), True))
         self.__work_thread.join()
+        self.__raise_error()